@@ -67,6 +67,33 @@ def has_space(
     return idx == len(enclosing_string) - 1 or enclosing_string[idx + 1] == " "
 
 
+def find_marker_matches(text: str,
+                        markers: List[str]) -> List[Tuple[int, int]]:
+    """Finds all case-insensitive occurrences of every marker in text.
+
+    The text is lowered once and each marker is located with str.find()
+    in a single linear pass, instead of rescanning the remaining text for
+    every marker after each match.
+
+    Returns:
+        A list of (start_position, marker_index) pairs, sorted so that
+        earlier starts come first and, for matches starting at the same
+        position, markers keep their order in the markers list.
+    """
+    lower_text = text.lower()
+    matches = []
+    for marker_idx, marker in enumerate(markers):
+        lower_marker = marker.lower()
+        if not lower_marker:
+            continue
+        start = lower_text.find(lower_marker)
+        while start != -1:
+            matches.append((start, marker_idx))
+            start = lower_text.find(lower_marker, start + 1)
+    matches.sort()
+    return matches
+
+
 def modified_mask_encodings(
         encoding: List[int], tok,
         markers: List[str]) -> Tuple[List[int], List[List[int]]]:
@@ -101,17 +128,16 @@ def modified_mask_encodings(
     special_tokens = tok.get_added_vocab().keys()
     new_txt_parts = []
     iter_txt = decoded_txt
+    offset = 0
     seqs_to_mask = []
-    while True:
-        found_markers_start_pos = [
-            iter_txt.lower().find(marker.lower()) for marker in markers
-        ]
-        idx = min(filter(lambda x: x >= 0, found_markers_start_pos),
-                  default=-1)
-        marker = markers[found_markers_start_pos.index(idx)]
-        if idx == -1:
-            new_txt_parts.append(iter_txt)
-            break
+    for match_start, marker_idx in find_marker_matches(decoded_txt, markers):
+        # Matches that overlap an already consumed match are skipped, as
+        # the earlier per-suffix rescans would never have found them.
+        if match_start < offset:
+            continue
+
+        marker = markers[marker_idx]
+        idx = match_start - offset
 
         prev_part = None if len(new_txt_parts) == 0 else new_txt_parts[-1]
 
@@ -145,6 +171,9 @@ def modified_mask_encodings(
             new_txt_parts.append(iter_txt[:idx + len(marker)])
 
         iter_txt = iter_txt[idx + len(marker):]
+        offset = match_start + len(marker)
+
+    new_txt_parts.append(iter_txt)
 
     new_encoding = tok.encode("".join(new_txt_parts))
 
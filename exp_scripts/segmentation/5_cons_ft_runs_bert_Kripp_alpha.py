@@ -1,5 +1,4 @@
 import warnings
-from itertools import chain
 from typing import List, Tuple
 warnings.filterwarnings('ignore')
 
@@ -19,18 +18,45 @@ device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
 
 
 
+_tok_model_cache = {}
+
 def get_tok_model(tokenizer_version, model_version):
+    key = (tokenizer_version, model_version)
+    if key in _tok_model_cache:
+        tokenizer, transformer_model, init_state_dict = _tok_model_cache[key]
+        #Reset the cached model to its pretrained weights in place, instead
+        #of re-reading ~440MB of fp32 weights from disk every run.
+        transformer_model.load_state_dict(init_state_dict)
+        return tokenizer, transformer_model
+
     tokenizer = BertTokenizer.from_pretrained(tokenizer_version,
                                               bos_token = "[CLS]",
                                               eos_token = "[SEP]",)
 
     transformer_model = BertModel.from_pretrained(model_version).to(device)
-    
+
+    #Recompute activations during backward instead of storing them; the
+    #memory freed pays for the doubled per-step micro-batch in train().
+    transformer_model.config.use_cache = False
+    transformer_model.gradient_checkpointing_enable()
+
+
     if tokenizer_version=='bert-base-cased':
         tokenizer.add_tokens(data_config["special_tokens"])
     if model_version=='bert-base-cased':
         transformer_model.resize_token_embeddings(len(tokenizer))
-    
+
+    #Graph-capture the encoder forward to cut Python dispatch between ops;
+    #the CRF head stays eager, its data-dependent loops would only cause
+    #graph breaks.
+    transformer_model = torch.compile(transformer_model,
+                                      mode='reduce-overhead',
+                                      fullgraph=False)
+
+    init_state_dict = {k: v.detach().cpu().clone()
+                       for k, v in transformer_model.state_dict().items()}
+    _tok_model_cache[key] = (tokenizer, transformer_model, init_state_dict)
+
     return tokenizer, transformer_model
 
 
@@ -47,44 +73,74 @@ def get_datasets(train_sz, test_sz):
     return train_dataset, valid_dataset, test_dataset
 
 
-def split_encoding(tokenized_thread: List[int], 
-                   split_on: List[int], 
-                   eos_token_id: int) -> List[List[int]]:
-    """Splits tokenized_thread into multiple lists at each occurance of 
-    a token_id specified in split_on or the eos_token_id.
-    
+def split_encoding(tokenized_thread: np.ndarray,
+                   split_token_mask: np.ndarray,
+                   eos_token_id: int) -> List[np.ndarray]:
+    """Splits tokenized_thread into multiple arrays at each occurance of
+    a token_id marked True in split_token_mask or the eos_token_id.
+
     1. The eos_token_id is retained in the last splitted component.
-    2. Each matched token_id from split_on is retained in the component that 
-       follows it.
+    2. Each token_id marked in split_token_mask is retained in the component
+       that follows it.
+
+    The thread is scanned with vectorized bitmap lookups instead of a
+    per-token Python loop: split points fall out of a single fancy-indexing
+    pass over the whole array.
     """
-    splitted = [[]]
-    for elem in tokenized_thread:
-        if elem in split_on:
-            splitted.append([])
-        splitted[-1].append(elem)
-        if elem == eos_token_id:
-            break
-    return splitted
-
-def pad_batch(elems: List[List[int]], pad_token_id: int) -> List[List[int]]:
-    """Pads all lists in elems to the maximum list length of any list in 
-    elems. Pads with pad_token_id.
+    eos_positions = np.flatnonzero(tokenized_thread == eos_token_id)
+    if eos_positions.size > 0:
+        tokenized_thread = tokenized_thread[:eos_positions[0]+1]
+    split_points = np.flatnonzero(split_token_mask[tokenized_thread])
+    return np.split(tokenized_thread, split_points)
+
+def pad_batch(elems: List[List[int]], pad_token_id: int,
+              dtype=np.int32) -> np.ndarray:
+    """Pads all lists in elems to the maximum list length of any list in
+    elems. Pads with pad_token_id. Returns a single [batch_size, max_len]
+    array of the given dtype, filled once and row-copied at C level
+    instead of building per-element Python lists. The BERT vocab fits in
+    int32 and the label set in int8, which halves (or better) the bytes
+    the H2D copy moves versus default int64.
     """
     max_len = max([len(elem) for elem in elems])
-    return [elem+[pad_token_id]*(max_len-len(elem)) for elem in elems]
+    arr = np.full((len(elems), max_len), pad_token_id, dtype=dtype)
+    for i, elem in enumerate(elems):
+        arr[i, :len(elem)] = elem
+    return arr
+
+_split_token_masks = {}
+
+def get_split_token_mask(tokenizer) -> np.ndarray:
+    """Returns a boolean bitmap over the vocab marking the user tokens at
+    which threads are split into comments. tokenizer.encode() runs the full
+    BertTokenizer state machine over the user-token string, so the bitmap
+    is computed once per tokenizer and cached.
+    """
+    if tokenizer not in _split_token_masks:
+        user_token_indices = tokenizer.encode("[UNU]"+"".join([f"[USER{i}]" for i in range(data_config["max_users"])]))[1:-1]
+        split_token_mask = np.zeros(len(tokenizer), dtype=np.bool_)
+        split_token_mask[user_token_indices] = True
+        _split_token_masks[tokenizer] = split_token_mask
+    return _split_token_masks[tokenizer]
 
 def get_comment_wise_dataset(dataset,
                              max_len: int=512,
-                             batch_size: int=8) -> Tuple[List[List[int]], 
-                                                         List[List[int]], 
-                                                         List[List[int]]]:
+                             batch_size: int=8,
+                             sort_by_length: bool=True) -> Tuple[np.ndarray,
+                                                                 np.ndarray,
+                                                                 np.ndarray]:
     """
     Args:
-        dataset:     A numpy iterator dataset for threads, as returned from 
-                     get_datasets() function above.
-        max_len:     Maximum length at which to truncate any comment.
-        batch_size:  Number of comments in a batch
-    
+        dataset:         A numpy iterator dataset for threads, as returned from
+                         get_datasets() function above.
+        max_len:         Maximum length at which to truncate any comment.
+        batch_size:      Number of comments in a batch
+        sort_by_length:  If True, comments are bucketed by length so that
+                         each batch only pads to the length of similarly
+                         sized comments. Attention cost is quadratic in the
+                         padded length, so this stops 7 short comments from
+                         paying for one 512-token one.
+
     Returns:
         A tuple having batched & padded(to max. length in batch) tokenized threads, 
         masked threads, and component type labels; where each element corresponds
@@ -94,37 +150,113 @@ def get_comment_wise_dataset(dataset,
         This function removes the extra num_devices dimension from the elements 
         of dataset provided.
     """
-    user_token_indices = tokenizer.encode("[UNU]"+"".join([f"[USER{i}]" for i in range(data_config["max_users"])]))[1:-1]
-    comment_wise_tokenized_threads = []
-    comment_wise_masked_threads = []
-    comment_wise_comp_type_labels = []
+    split_token_mask = get_split_token_mask(tokenizer)
+    pad_token_id, eos_token_id = tokenizer.pad_token_id, tokenizer.eos_token_id
+    label_pad_id = data_config["pad_for"]["comp_type_labels"]
+
+    comments = []
 
     for (tokenized_threads, masked_threads, comp_type_labels, _ ) in dataset:
-        tokenized_threads = np.squeeze(tokenized_threads, axis=0).tolist()
-        masked_threads = np.squeeze(masked_threads, axis=0).tolist()
-        comp_type_labels = np.squeeze(comp_type_labels, axis=0).tolist()
+        tokenized_threads = np.squeeze(tokenized_threads, axis=0)
+        masked_threads = np.squeeze(masked_threads, axis=0)
+        comp_type_labels = np.squeeze(comp_type_labels, axis=0)
 
         for tokenized_thread, masked_thread, comp_type_label in zip(tokenized_threads, masked_threads, comp_type_labels):
-            splitted_encodings = split_encoding(tokenized_thread, user_token_indices, tokenizer.eos_token_id)
+            splitted_encodings = split_encoding(tokenized_thread, split_token_mask, eos_token_id)
             for elem in splitted_encodings:
-                comment_wise_tokenized_threads.append(elem)
-                comment_wise_masked_threads.append(masked_thread[:len(elem)])
-                comment_wise_comp_type_labels.append(comp_type_label[:len(elem)])
+                trunc_len = min(len(elem), max_len)
+                comments.append((elem[:trunc_len],
+                                 masked_thread[:trunc_len],
+                                 comp_type_label[:trunc_len]))
                 masked_thread, comp_type_label = masked_thread[len(elem):], comp_type_label[len(elem):]
-    i = 0
-    cw_tokenized_threads, cw_masked_threads, cw_comp_type_labels = [], [], []
-    while i<len(comment_wise_tokenized_threads):
-         cw_tokenized_threads.append(comment_wise_tokenized_threads[i][:max_len])
-         cw_masked_threads.append(comment_wise_masked_threads[i][:max_len])
-         cw_comp_type_labels.append(comment_wise_comp_type_labels[i][:max_len])
-         i += 1
-         
-         if i%batch_size==0:
-             yield (pad_batch(cw_tokenized_threads, tokenizer.pad_token_id), 
-                    pad_batch(cw_masked_threads, tokenizer.pad_token_id),
-                    pad_batch(cw_comp_type_labels, data_config["pad_for"]["comp_type_labels"]))
-            
-             cw_tokenized_threads, cw_masked_threads, cw_comp_type_labels = [], [], []
+
+    if sort_by_length:
+        comments.sort(key=lambda comment: len(comment[0]))
+
+    for i in range(0, len(comments)-batch_size+1, batch_size):
+        batch = comments[i:i+batch_size]
+        yield (pad_batch([comment[0] for comment in batch], pad_token_id),
+               pad_batch([comment[1] for comment in batch], pad_token_id),
+               pad_batch([comment[2] for comment in batch], label_pad_id, dtype=np.int8))
+
+
+class CUDAPrefetcher:
+    """Wraps an iterable of NumPy batches [as yielded by
+    get_comment_wise_dataset()] and moves each batch to device on a side
+    CUDA stream, one batch ahead of the training loop. The H2D copy of the
+    next batch then overlaps with compute on the current one. Batches are
+    staged through a small ring of reusable pinned host buffers, so async
+    DMA runs at full bandwidth without pin_memory() allocating fresh pinned
+    pages per batch. Falls back to plain synchronous copies when no GPU is
+    available.
+    """
+    def __init__(self, gen):
+        self.gen = iter(gen)
+        if torch.cuda.is_available():
+            self.stream = torch.cuda.Stream()
+            #Two staging slots, used round-robin; each slot's event guards
+            #against overwriting pinned buffers whose copy is in flight.
+            self.pinned = [[], []]
+            self.events = [torch.cuda.Event(), torch.cuda.Event()]
+            self.slot = 0
+        else:
+            self.stream = None
+        self._preload()
+
+    def _stage(self, arr: np.ndarray, slot_buffers: List[torch.Tensor],
+               idx: int) -> torch.Tensor:
+        """Copies arr into the idx-th pinned buffer of a slot, growing the
+        buffer whenever a batch exceeds anything staged through it so far.
+        """
+        tensor = torch.from_numpy(arr)
+        if idx==len(slot_buffers):
+            slot_buffers.append(torch.empty_like(tensor).pin_memory())
+        buffer = slot_buffers[idx]
+        if (buffer.dtype!=tensor.dtype or buffer.shape[0]<tensor.shape[0]
+                or buffer.shape[1]<tensor.shape[1]):
+            buffer = torch.empty((max(buffer.shape[0], tensor.shape[0]),
+                                  max(buffer.shape[1], tensor.shape[1])),
+                                 dtype=tensor.dtype).pin_memory()
+            slot_buffers[idx] = buffer
+        staged = buffer[:tensor.shape[0], :tensor.shape[1]]
+        staged.copy_(tensor)
+        return staged
+
+    def _preload(self):
+        try:
+            batch = next(self.gen)
+        except StopIteration:
+            self.next_batch = None
+            return
+
+        if self.stream is None:
+            self.next_batch = [torch.from_numpy(arr).to(device) for arr in batch]
+            return
+
+        slot = self.slot
+        self.slot = 1-self.slot
+        self.events[slot].synchronize()
+        staged = [self._stage(arr, self.pinned[slot], i)
+                  for i, arr in enumerate(batch)]
+        with torch.cuda.stream(self.stream):
+            self.next_batch = [tensor.to(device, non_blocking=True)
+                               for tensor in staged]
+            self.events[slot].record(self.stream)
+
+    def next(self):
+        """Returns the next batch of device tensors, or None once the
+        underlying generator is exhausted.
+        """
+        if self.next_batch is None:
+            return None
+        if self.stream is not None:
+            torch.cuda.current_stream().wait_stream(self.stream)
+            for tensor in self.next_batch:
+                tensor.record_stream(torch.cuda.current_stream())
+        batch = self.next_batch
+        self._preload()
+        return batch
+
 
 ### Define layers for a Linear-Chain-CRF
 
@@ -136,9 +268,17 @@ allowed_transitions =([(ac_dict["B-C"], ac_dict["I-C"]),
                         for ct in ["I-C", "B-C", "B-P", "O"]] +
                       [(ac_dict["I-P"], ac_dict[ct]) 
                         for ct in ["I-P", "B-C", "B-P", "O"]] +
-                      [(ac_dict["O"], ac_dict[ct]) 
+                      [(ac_dict["O"], ac_dict[ct])
                         for ct in ["O", "B-C", "B-P"]])
-                    
+
+#Decode-time constraint matrix: -10000 at disallowed (from_tag, to_tag)
+#entries and 0 at allowed ones, built once instead of per Viterbi call.
+transition_penalty = torch.full((len(ac_dict), len(ac_dict)), -10000.,
+                                device=device)
+for (from_tag, to_tag) in allowed_transitions:
+    transition_penalty[from_tag, to_tag] = 0.
+
+
 def get_crf_head():
     linear_layer = nn.Linear(transformer_model.config.hidden_size,
                              len(ac_dict)).to(device)
@@ -150,11 +290,90 @@ def get_crf_head():
     return linear_layer, crf_layer
 
 
-cross_entropy_layer = nn.CrossEntropyLoss(weight=torch.log(torch.tensor([3.3102, 61.4809, 3.6832, 49.6827, 2.5639], 
-                                                                        device=device)), reduction='none')
+cross_entropy_layer = nn.CrossEntropyLoss(weight=torch.log(torch.tensor([3.3102, 61.4809, 3.6832, 49.6827, 2.5639],
+                                                                        device=device)), reduction='sum')
 
 """### Loss and Prediction Function"""
 
+@torch.jit.script
+def crf_log_partition(emissions: torch.Tensor, transitions: torch.Tensor,
+                      mask: torch.Tensor) -> torch.Tensor:
+    """Computes the CRF log-partition per sample with the same seq_len-step
+    log-sum-exp recursion as allennlp's forward, but compiled to
+    TorchScript so every step dispatches from C++ instead of Python.
+
+    Args:
+        emissions:    Emission scores of shape [batch_size, seq_len, num_tags].
+        transitions:  Learned [num_tags, num_tags] transition scores.
+        mask:         Bool padding mask of shape [batch_size, seq_len].
+    """
+    alpha = emissions[:, 0]
+    for t in range(1, emissions.size(1)):
+        broadcast = alpha.unsqueeze(2) + transitions.unsqueeze(0) + emissions[:, t].unsqueeze(1)
+        new_alpha = torch.logsumexp(broadcast, dim=1)
+        alpha = torch.where(mask[:, t].unsqueeze(1), new_alpha, alpha)
+    return torch.logsumexp(alpha, dim=-1)
+
+@torch.jit.script
+def crf_gold_score(emissions: torch.Tensor, tags: torch.Tensor,
+                   transitions: torch.Tensor,
+                   mask: torch.Tensor) -> torch.Tensor:
+    """Scores the gold tag sequences under the CRF: emissions at the gold
+    tags plus transitions between consecutive unmasked gold tags. Shapes
+    as in crf_log_partition(), with tags of shape [batch_size, seq_len].
+    """
+    score = emissions[:, 0].gather(1, tags[:, 0:1]).squeeze(1)
+    for t in range(1, tags.size(1)):
+        emit = emissions[:, t].gather(1, tags[:, t:t+1]).squeeze(1)
+        trans = transitions[tags[:, t-1], tags[:, t]]
+        score = score + (emit + trans) * mask[:, t].to(emissions.dtype)
+    return score
+
+def batched_viterbi_tags(logits: torch.Tensor,
+                         mask: torch.Tensor) -> List[Tuple[np.ndarray, float]]:
+    """Viterbi-decodes all sequences in a batch in parallel, keeping a
+    [batch_size, num_tags] score tensor and [batch_size, seq_len, num_tags]
+    backpointers, instead of allennlp's per-sample Python loop.
+
+    Args:
+        logits:  Emission scores of shape [batch_size, seq_len, num_tags].
+        mask:    Padding mask of shape [batch_size, seq_len]; positions
+                 with 0 are ignored.
+
+    Returns:
+        Same structure as crf.viterbi_tags(): a list with one
+        (tag_sequence, viterbi_score) tuple per sample in the batch, with
+        the tag_sequence as a 1-D integer ndarray.
+    """
+    batch_size, seq_len, num_tags = logits.shape
+    mask = mask.bool()
+
+    transitions = crf_layer.transitions.detach() + transition_penalty
+
+    backpointers = torch.zeros((batch_size, seq_len, num_tags),
+                               dtype=torch.long, device=logits.device)
+    scores = logits[:, 0]
+    for t in range(1, seq_len):
+        broadcast = scores.unsqueeze(2) + transitions.unsqueeze(0) + logits[:, t].unsqueeze(1)
+        best_scores, best_prev_tags = broadcast.max(dim=1)
+        scores = torch.where(mask[:, t].unsqueeze(1), best_scores, scores)
+        backpointers[:, t] = best_prev_tags
+
+    viterbi_scores, current_tags = scores.max(dim=-1)
+
+    tags = torch.zeros((batch_size, seq_len), dtype=torch.long,
+                       device=logits.device)
+    for t in range(seq_len-1, -1, -1):
+        tags[:, t] = torch.where(mask[:, t], current_tags, tags[:, t])
+        if t > 0:
+            prev_tags = backpointers[:, t].gather(1, current_tags.unsqueeze(1)).squeeze(1)
+            current_tags = torch.where(mask[:, t], prev_tags, current_tags)
+
+    lengths = mask.sum(dim=1).cpu().numpy()
+    tags, viterbi_scores = tags.cpu().numpy(), viterbi_scores.cpu().numpy()
+    return [(tags[i, :lengths[i]], viterbi_scores[i])
+            for i in range(batch_size)]
+
 def compute(batch: Tuple[torch.Tensor, torch.Tensor, torch.Tensor],
             preds: bool=False, cross_entropy: bool=True):
     """
@@ -178,23 +397,41 @@ def compute(batch: Tuple[torch.Tensor, torch.Tensor, torch.Tensor],
     """
     tokenized_threads, token_type_ids, comp_type_labels = batch
     
-    pad_mask = torch.where(tokenized_threads!=tokenizer.pad_token_id, 1, 0)
-    
-    logits = linear_layer(transformer_model(input_ids=tokenized_threads,
-                                            attention_mask=pad_mask,).last_hidden_state)
-    
+    #One comparison kernel producing a bool mask, instead of
+    #torch.where(cond, 1, 0)'s compare + select into int64.
+    pad_mask = tokenized_threads != tokenizer.pad_token_id
+
+    with torch.cuda.amp.autocast(enabled=torch.cuda.is_available(),
+                                 dtype=torch.bfloat16):
+        #Ids travel to the GPU as int32; the cast to long for the embedding
+        #gather is one cheap on-device kernel.
+        logits = linear_layer(transformer_model(input_ids=tokenized_threads.long(),
+                                                attention_mask=pad_mask,).last_hidden_state)
+
+    #CRF and CE need full precision for stable log-sum-exp; only the BERT
+    #forward/backward runs in bf16.
+    logits = logits.float()
+
     if preds:
-        return crf_layer.viterbi_tags(logits, pad_mask)
+        return batched_viterbi_tags(logits, pad_mask)
     
-    log_likelihood = crf_layer(logits, comp_type_labels, pad_mask)
+    gold_tags = comp_type_labels.long()
+    log_likelihood = torch.sum(crf_gold_score(logits, gold_tags,
+                                              crf_layer.transitions, pad_mask)
+                               - crf_log_partition(logits, crf_layer.transitions,
+                                                   pad_mask))
     
     if cross_entropy:
-        logits = logits.reshape(-1, logits.shape[-1])
-        
-        pad_mask, comp_type_labels = pad_mask.reshape(-1), comp_type_labels.reshape(-1)
-        
-        ce_loss = torch.sum(pad_mask*cross_entropy_layer(logits, comp_type_labels))
-        
+        #Select the non-pad positions first, so the softmax+NLL only runs
+        #over real tokens instead of being computed everywhere and masked.
+        valid = pad_mask.reshape(-1)
+
+        logits = logits.reshape(-1, logits.shape[-1])[valid]
+        #CE targets must be long; cast after compressing to valid positions.
+        comp_type_labels = comp_type_labels.reshape(-1)[valid].long()
+
+        ce_loss = cross_entropy_layer(logits, comp_type_labels)
+
         return ce_loss - log_likelihood
 
     return -log_likelihood
@@ -202,21 +439,22 @@ def compute(batch: Tuple[torch.Tensor, torch.Tensor, torch.Tensor],
 
 """### Training And Evaluation Loops"""
 
-def train(dataset):
-    accumulate_over = 4
-    
-    optimizer.zero_grad()
+def train(batches):
+    accumulate_over = 2
+
+    optimizer.zero_grad(set_to_none=True)
+
+    #Batches are materialized in length order; shuffling the batch order
+    #each epoch keeps SGD noise without reintroducing padding.
+    batches = [batches[i] for i in np.random.permutation(len(batches))]
 
     i=0
-    for (tokenized_threads, masked_threads, comp_type_labels) in get_comment_wise_dataset(dataset):
-        
-        #Cast to PyTorch tensor
-        tokenized_threads = torch.tensor(tokenized_threads, device=device)
-        masked_threads = torch.tensor(masked_threads, device=device)
-        comp_type_labels = torch.tensor(comp_type_labels, device=device, dtype=torch.long)
-        
+    prefetcher = CUDAPrefetcher(batches)
+    while (batch := prefetcher.next()) is not None:
+        tokenized_threads, masked_threads, comp_type_labels = batch
+
         loss = compute((tokenized_threads,
-                        torch.where(masked_threads==tokenizer.mask_token_id, 1, 0), 
+                        (masked_threads==tokenizer.mask_token_id).to(torch.long),
                         comp_type_labels,))/data_config["batch_size"]
         
         print("Loss: ", loss)
@@ -224,41 +462,42 @@ def train(dataset):
         
         if i%accumulate_over==accumulate_over-1:
             optimizer.step()
-            optimizer.zero_grad()
+            optimizer.zero_grad(set_to_none=True)
         
         i += 1
 
     optimizer.step()
 
-def evaluate(dataset, metric):
-    
+def evaluate(batches, metric):
+
     int_to_labels = {v:k for k, v in ac_dict.items()}
+    #Object ndarray indexed by label id: ids are mapped to label strings
+    #with one fancy-indexing call per sample, not a dict lookup per token.
+    label_lut = np.array([int_to_labels[i] for i in range(len(ac_dict))],
+                         dtype=object)
     with torch.no_grad():
-        for tokenized_threads, masked_threads, comp_type_labels in get_comment_wise_dataset(dataset):
-        
-            #Cast to PyTorch tensor
-            tokenized_threads = torch.tensor(tokenized_threads, device=device)
-            masked_threads = torch.tensor(masked_threads, device=device)
-            comp_type_labels = torch.tensor(comp_type_labels, device=device)
-            
+        prefetcher = CUDAPrefetcher(batches)
+        while (batch := prefetcher.next()) is not None:
+            tokenized_threads, masked_threads, comp_type_labels = batch
+
             preds = compute((tokenized_threads,
-                            torch.where(masked_threads==tokenizer.mask_token_id, 1, 0), 
+                            (masked_threads==tokenizer.mask_token_id).to(torch.long),
                             comp_type_labels,), preds=True)
-            
-            lengths = torch.sum(torch.where(tokenized_threads!=tokenizer.pad_token_id, 1, 0), 
-                                axis=-1)
-            
-            preds = [ [int_to_labels[pred] for pred in pred[0][:lengths[i]]]
+
+            lengths = (tokenized_threads!=tokenizer.pad_token_id).sum(axis=-1).cpu().numpy()
+            labels_np = comp_type_labels.cpu().numpy()
+
+            preds = [ label_lut[pred[0][:lengths[i]]].tolist()
                     for i, pred in enumerate(preds)
                     ]
-            
-            refs = [ [int_to_labels[ref] for ref in labels[:lengths[i]]]
-                    for i, labels in enumerate(comp_type_labels.cpu().tolist())
+
+            refs = [ label_lut[labels_np[i, :lengths[i]]].tolist()
+                    for i in range(labels_np.shape[0])
                 ]
             
-            metric.add_batch(predictions=preds, 
+            metric.add_batch(predictions=preds,
                             references=refs,
-                            tokenized_threads=tokenized_threads.cpu().tolist())
+                            tokenized_threads=tokenized_threads.cpu().numpy())
         
         print("\t\t\t\t Metric computations:", metric.compute())
 
@@ -284,20 +523,31 @@ for (tokenizer_version, model_version) in [('bert-base-cased', 'bert-base-cased'
 
             linear_layer, crf_layer = get_crf_head()
 
-            optimizer = optim.Adam(params = chain(transformer_model.parameters(),
-                                      linear_layer.parameters(),
-                                      crf_layer.parameters()),
-                                   lr = 2e-5,)
+            #One container over encoder + head: the optimizer gets every
+            #parameter from a single module instead of a chained iterator.
+            model = nn.ModuleList([transformer_model, linear_layer, crf_layer])
+
+            optimizer = optim.Adam(params = model.parameters(),
+                                   lr = 2e-5,
+                                   fused = torch.cuda.is_available(),)
 
             train_dataset, _, test_dataset = get_datasets(train_sz, test_sz)
             train_dataset = [elem for elem in train_dataset]
             test_dataset = [elem for elem in test_dataset]
-            
+
+            #The comment-wise batching is deterministic for a frozen dataset;
+            #materialize it once and reuse the padded batches in every epoch.
+            #With checkpointing enabled, twice the comments fit per step;
+            #accumulate_over in train() is halved so the effective batch
+            #stays at 32 comments.
+            train_batches = list(get_comment_wise_dataset(train_dataset, batch_size=16))
+            test_batches = list(get_comment_wise_dataset(test_dataset))
+
             metric = krip_alpha(tokenizer)
 
             for epoch in range(n_epochs):
                 print(f"\t\t\t------------EPOCH {epoch+1}---------------")
-                train(train_dataset)
-                evaluate(test_dataset, metric)
+                train(train_batches)
+                evaluate(test_batches, metric)
 
             del tokenizer, transformer_model, linear_layer, crf_layer
@@ -49,7 +49,9 @@ class krip_alpha():
         threads_lis = []
         for i, thread in enumerate(threads):
             threads_lis.append([])
-            thread = [elem for elem in thread if elem!=self.tokenizer.pad_token_id]
+            #int() coercion keeps the rest of the pipeline on Python ints
+            #when threads arrive as NumPy rows instead of lists.
+            thread = [int(elem) for elem in thread if elem!=self.tokenizer.pad_token_id]
             txt_thread = self.tokenizer.decode(thread)
 #            print("txt thread:", txt_thread)
             sentences = [sent.text for sent in self.nlp(txt_thread).sents]